@@ -7,12 +7,28 @@ class Config:
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.environ.get("UPLOAD_FOLDER", "video_processing/uploads"))
     PROCESSED_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.environ.get("PROCESSED_FOLDER", "video_processing/processed"))
     # Gemini model adı
-    GEMINI_MODEL = "gemini-1.5-flash"
+    GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")
     # Gemini için sistem promptu
     GEMINI_SYSTEM_PROMPT = """
     Sen, 'Klip Asistanı' adında uzman bir video editörüsün. Görevin, kullanıcının komutlarını anlayıp sağlanan videodan kesilecek anları belirlemektir. Cevapların daima iki kısımdan oluşmalı: 1. `cuts` adında bir anahtar altında kesimler için geçerli bir JSON zaman damgası dizisi. Dizideki her öğe `{"start": "00:00:05", "end": "00:00:10"}` formatında saniye veya dakika:saniye veya saat:dakika:saniye olabilir. 2. `message` adında bir anahtar altında kullanıcıya yönelik dostça bir mesaj. Kullanıcının komutu anlamsızsa veya video içeriğiyle alakasızsa, `cuts` dizisini boş bırak ([]) ve bunu `message` içinde kibarca belirt. Zaman damgaları videonun süresini aşmamalıdır.
     """
     # Konuşma geçmişini saklamak için Redis anahtar formatı
     REDIS_CHAT_HISTORY_KEY = "chat_history:{}" # {video_id} formatlanacak
-
-
+    # /metrics uç noktasında derinliği raporlanacak Celery kuyrukları
+    METRICS_QUEUES = [q.strip() for q in os.environ.get("METRICS_QUEUES", "celery").split(",") if q.strip()]
+    # finalize için isimli çıktı profilleri (yeniden kodlama). fit: "pad" (siyah
+    # bantlarla sığdır) veya "crop" (ortadan kırp). threads: profil başına kodlayıcı iş parçacığı
+    OUTPUT_PROFILES = {
+        "master": {"width": 1920, "height": 1080, "fit": "pad", "vcodec": "libx264", "crf": 20, "preset": "medium", "threads": 4, "acodec": "aac", "audio_bitrate": "192k"},
+        "vertical": {"width": 1080, "height": 1920, "fit": "crop", "vcodec": "libx264", "crf": 22, "preset": "medium", "threads": 4, "acodec": "aac", "audio_bitrate": "160k"},
+        "preview": {"width": 640, "height": 360, "fit": "pad", "vcodec": "libx264", "crf": 30, "preset": "veryfast", "threads": 1, "acodec": "aac", "audio_bitrate": "96k"},
+    }
+    # Yüklemeleri analiz sırasında fast-start MP4'e kayıpsız remux et
+    REMUX_UPLOADS = os.environ.get("REMUX_UPLOADS", "true").lower() == "true"
+    # Video isteği başına hedeflenen en fazla girdi tokenı (örnekleme planlayıcısı için)
+    GEMINI_TOKEN_BUDGET = int(os.environ.get("GEMINI_TOKEN_BUDGET", "300000"))
+    # Uzun video modu: pencere uzunluğu ve komşu pencerelerin örtüşmesi (saniye)
+    LONG_VIDEO_WINDOW_SECONDS = float(os.environ.get("LONG_VIDEO_WINDOW_SECONDS", "600"))
+    LONG_VIDEO_WINDOW_OVERLAP_SECONDS = float(os.environ.get("LONG_VIDEO_WINDOW_OVERLAP_SECONDS", "30"))
+    # Idempotency anahtarlarının ve single-flight kayıtlarının Redis'te tutulma süresi (saniye)
+    IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "86400"))
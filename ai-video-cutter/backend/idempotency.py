@@ -0,0 +1,102 @@
+# backend/idempotency.py
+# Upload, chat ve finalize istekleri için idempotency anahtarları ve Redis
+# kilidiyle single-flight birleştirme. Aynı anahtarla (veya anahtar yoksa aynı
+# içerikle) gelen istek, yeni iş başlatmak yerine mevcut görevin yanıtını alır.
+import hashlib
+import json
+
+from redis.exceptions import LockError
+
+import metrics
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+_KEY_FORMAT = "idempotency:{}:{}"  # {kind}, {anahtar veya içerik özeti}
+
+# Bu durumlardaki görevler artık "uçuşta" sayılmaz
+READY_STATES = {"SUCCESS", "FAILURE", "REVOKED"}
+
+
+class IdempotencyConflict(Exception):
+    """Aynı idempotency anahtarı farklı içerikli bir istekte yeniden kullanıldı."""
+
+
+class SingleFlightBusy(Exception):
+    """Single-flight kilidi zamanında alınamadı."""
+
+
+def request_fingerprint(payload):
+    """İstek içeriğinin kararlı (anahtar sırasından bağımsız) SHA-256 özeti."""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+def single_flight(redis_client, kind, start, idempotency_key=None, payload=None,
+                  task_state=None, ttl=86400, lock_timeout=30, prepare=None, discard=None):
+    """
+    kind için start() çağrısını tekilleştirir ve (yanıt, yeni_mi) döndürür.
+
+    - idempotency_key verilirse: anahtarın TTL süresi boyunca aynı yanıt döner.
+      Kayıt isteğin içerik özetiyle saklanır; anahtar farklı içerikle (örn.
+      başka bir video ya da başka kesimler) tekrar kullanılırsa
+      IdempotencyConflict yükseltilir.
+    - Yalnızca payload verilirse: aynı içerikli görev hâlâ çalışıyorsa (task_state
+      ile kontrol edilir) ona bağlanılır, bittiyse yeni iş başlatılır.
+
+    Uzun süren hazırlık (örn. büyük dosyanın diske yazılması) prepare() ile
+    kilit dışında yapılır; kilit yalnızca görevi kuyruğa koyan kısa start(hazırlık)
+    çağrısı boyunca tutulur. Yarışı kaybeden isteğin hazırlığı discard() ile
+    geri alınır. start(), JSON'a çevrilebilir ve "task_id" içeren bir sözlük
+    döndürmelidir. Kilit zamanında alınamazsa SingleFlightBusy yükseltilir.
+    """
+    fingerprint = request_fingerprint(payload) if payload is not None else None
+    if idempotency_key:
+        redis_key = _KEY_FORMAT.format(kind, f"key:{idempotency_key}")
+    elif fingerprint is not None:
+        redis_key = _KEY_FORMAT.format(kind, f"sha256:{fingerprint}")
+    else:
+        prepared = prepare() if prepare else None
+        return (start(prepared) if prepare else start()), True
+
+    def existing_response():
+        stored = redis_client.get(redis_key)
+        if not stored:
+            return None
+        record = json.loads(stored)
+        if idempotency_key and record.get("fingerprint") != fingerprint:
+            raise IdempotencyConflict(f"Idempotency key reused with a different {kind} request")
+        response = record["response"]
+        if not idempotency_key and task_state and task_state(response["task_id"]) in READY_STATES:
+            return None
+        return response
+
+    response = existing_response()
+    if response is not None:
+        metrics.record_cache(f"idempotency_{kind}", True)
+        return response, False
+
+    prepared = prepare() if prepare else None
+    lock = redis_client.lock(f"{redis_key}:lock", timeout=lock_timeout, blocking_timeout=lock_timeout)
+    if not lock.acquire():
+        if discard:
+            discard(prepared)
+        raise SingleFlightBusy(f"Could not acquire single-flight lock for {kind}")
+    try:
+        try:
+            response = existing_response()
+        except IdempotencyConflict:
+            if discard:
+                discard(prepared)
+            raise
+        if response is not None:
+            if discard:
+                discard(prepared)
+            metrics.record_cache(f"idempotency_{kind}", True)
+            return response, False
+        metrics.record_cache(f"idempotency_{kind}", False)
+        response = start(prepared) if prepare else start()
+        redis_client.set(redis_key, json.dumps({"fingerprint": fingerprint, "response": response}), ex=ttl)
+        return response, True
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            pass  # Kilit süresi dolmuş olabilir; yanıt zaten kaydedildi
@@ -1,31 +1,76 @@
 # backend/app.py
-from flask import Flask, request, jsonify
+import time
+PROCESS_STARTED = time.perf_counter() # Soğuk başlangıç ölçümü için
+from flask import Flask, Blueprint, current_app, request, jsonify, Response
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
 import uuid # Video ID'leri için
-import time # Durum takibi için basit bir örnek
 from config import Config
+import metrics
+import media
+import idempotency
+import planner
+import startup
 
 # Ortam değişkenlerini yükle
 load_dotenv()
 
-app = Flask(__name__)
-app.config.from_object(Config) # Yapılandırmayı yükle
-CORS(app) # Frontend'den gelen isteklere izin ver
+api = Blueprint("api", __name__)
 
 # Basit bir durum takip sistemi (Redis/Celery entegrasyonundan önce)
 # Gerçek uygulamada Redis veya veritabanı kullanılacak
 video_status = {}
 chat_histories = {} # video_id: [{"role": "user", "parts": [...]}, ...]
 
-@app.route('/')
+@api.route('/')
 def index():
     return "AI Video Cutter Backend Çalışıyor!"
 
+@api.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus metriklerini ve Celery kuyruk derinliklerini sunar"""
+    from tasks import get_redis_client
+    metrics.update_queue_depths(get_redis_client(), current_app.config["METRICS_QUEUES"])
+    body, content_type = metrics.render_metrics()
+    return Response(body, mimetype=content_type)
+
 # --- API Endpoints (Placeholder - Detaylar sonraki adımlarda) ---
 
-@app.route("/api/upload", methods=["POST"])
+def _idempotency_key():
+    """Idempotency-Key başlığını ya da gövdedeki idempotency_key alanını okur."""
+    return (
+        request.headers.get(idempotency.IDEMPOTENCY_HEADER)
+        or request.form.get("idempotency_key")
+        or (request.get_json(silent=True) or {}).get("idempotency_key")
+    )
+
+def _task_state(task_id):
+    from tasks import celery_app
+    return celery_app.AsyncResult(task_id).state
+
+def _single_flight(kind, start, payload=None, prepare=None, discard=None):
+    """start() ile görevi başlatır ya da aynı istekteki çalışan göreve bağlanır."""
+    from tasks import get_redis_client
+    try:
+        response, started = idempotency.single_flight(
+            get_redis_client(), kind, start,
+            idempotency_key=_idempotency_key(),
+            payload=payload,
+            task_state=_task_state,
+            ttl=current_app.config["IDEMPOTENCY_TTL_SECONDS"],
+            prepare=prepare,
+            discard=discard,
+        )
+    except idempotency.IdempotencyConflict as e:
+        return jsonify({"error": str(e)}), 422
+    except idempotency.SingleFlightBusy as e:
+        return jsonify({"error": str(e)}), 503
+    if not started:
+        response = dict(response, deduplicated=True)
+    return jsonify(response), 202
+
+@api.route("/api/upload", methods=["POST"])
 def upload_video():
     if "file" not in request.files:
         return jsonify({"error": "No file part in the request"}), 400
@@ -33,20 +78,36 @@ def upload_video():
     if file.filename == "":
         return jsonify({"error": "No selected file"}), 400
     if file:
-        video_id = str(uuid.uuid4())
-        filename = f"{video_id}_{file.filename}"
-        upload_folder = app.config["UPLOAD_FOLDER"]
-        os.makedirs(upload_folder, exist_ok=True)
-        video_path = os.path.join(upload_folder, filename)
-        file.save(video_path)
+        def prepare():
+            # Büyük dosya single-flight kilidi alınmadan önce diske yazılır
+            video_id = str(uuid.uuid4())
+            filename = f"{video_id}_{file.filename}"
+            upload_folder = current_app.config["UPLOAD_FOLDER"]
+            os.makedirs(upload_folder, exist_ok=True)
+            video_path = os.path.join(upload_folder, filename)
+            file.save(video_path)
+            return video_id, video_path
+
+        def start(prepared):
+            video_id, video_path = prepared
+            metrics.set_video_id(video_id)
+            # Celery görevini başlat; /api/status/<video_id> ile izlenebilmesi için task_id = video_id
+            from tasks import analyze_video
+            analyze_video.apply_async((video_path, video_id), task_id=video_id)
+            return {"message": "Video yüklendi ve analiz başlatıldı", "video_id": video_id, "task_id": video_id}
 
-        # Celery görevini başlat
-        from tasks import analyze_video
-        analyze_video.delay(video_path, video_id)
+        def discard(prepared):
+            # Aynı anahtarla yarışı kaybeden ya da reddedilen isteğin kopyasını sil
+            os.remove(prepared[1])
 
-        return jsonify({"message": "Video yüklendi ve analiz başlatıldı", "video_id": video_id}), 202
+        # Dosya içeriği özetlenmez; yüklemeler yalnızca açık idempotency anahtarıyla tekilleştirilir.
+        # Anahtar başka bir dosya adıyla yeniden kullanılırsa 422 döner.
+        payload = {"filename": file.filename} if _idempotency_key() else None
+        # HTTP isteği için açılan iz, kuyruğa konan görevlere aktarılır
+        with metrics.stage("http.upload"):
+            return _single_flight("upload", start, payload=payload, prepare=prepare, discard=discard)
 
-@app.route("/api/status/<video_id>", methods=["GET"])
+@api.route("/api/status/<video_id>", methods=["GET"])
 def get_status(video_id):
     from tasks import celery_app
     task = celery_app.AsyncResult(video_id)
@@ -60,6 +121,8 @@ def get_status(video_id):
             "state": task.state,
             "status": task.info.get("status", "İşlem devam ediyor...")
         }
+        if "clips" in task.info:
+            response["clips"] = task.info["clips"]
     elif task.state == "SUCCESS":
         response = {
             "state": task.state,
@@ -79,77 +142,167 @@ def get_status(video_id):
         }
     return jsonify(response)
 
-@app.route("/api/chat/<video_id>", methods=["POST"])
+@api.route("/api/chat/<video_id>", methods=["POST"])
 def handle_chat(video_id):
     user_message = request.json.get("message")
     if not user_message:
         return jsonify({"error": "Message not provided"}), 400
 
-    from tasks import process_chat_command, redis_client
+    from tasks import process_chat_command, get_redis_client
     from config import Config
     import json
 
-    chat_history_key = Config.REDIS_CHAT_HISTORY_KEY.format(video_id)
-    current_history_json = redis_client.get(chat_history_key)
-    current_history = []
-    if current_history_json:
-        current_history = json.loads(current_history_json)
+    # Varsa analiz sırasında üretilen fast-start kopya kullanılır
+    video_path = media.find_video_path(current_app.config["UPLOAD_FOLDER"], video_id)
+    if not video_path:
+        return jsonify({"error": "Video not found"}), 404
+
+    mode = request.json.get("mode")
 
-    # Get video path (assuming it's stored somewhere or passed)
-    # For now, let's assume video_path can be retrieved from a global store or passed from frontend
-    # In a real app, you'd likely store this in a database or a more robust state management system
-    # For this example, we'll assume the video_path is available from the initial upload task result
-    # This is a simplification; a more robust solution would involve storing video metadata.
-    # For now, we'll just pass a placeholder video_path.
-    video_path = os.path.join(app.config["UPLOAD_FOLDER"], f"{video_id}_*.mp4") # This needs to be more precise
-    # A better way would be to store the actual filename in Redis or a database when uploaded.
-    # For now, let's just assume we can find it.
-    # Let's refine this: the analyze_video task should return the actual video_path and store it.
-    # For now, we'll just use a dummy path and focus on the chat logic.
+    def start():
+        redis_client = get_redis_client()
+        chat_history_key = Config.REDIS_CHAT_HISTORY_KEY.format(video_id)
+        current_history_json = redis_client.get(chat_history_key)
+        current_history = []
+        if current_history_json:
+            current_history = json.loads(current_history_json)
 
-    # Add user message to history before sending to Celery
-    current_history.append({"role": "user", "parts": [{"text": user_message}]})
+        # Add user message to history before sending to Celery
+        current_history.append({"role": "user", "parts": [{"text": user_message}]})
 
-    # Trigger Celery task for chat processing
-    task = process_chat_command.delay(video_path, video_id, user_message, current_history)
+        # Trigger Celery task for chat processing
+        # mode="long": zaman çizelgesi pencerelere bölünüp eşzamanlı analiz edilir
+        if mode == "long":
+            from tasks import long_video_chat_task
+            task = long_video_chat_task.delay(video_path, video_id, user_message)
+        else:
+            task = process_chat_command.delay(video_path, video_id, user_message, current_history)
 
-    # Update Redis with the new history (including user's message)
-    redis_client.set(chat_history_key, json.dumps(current_history))
+        # Update Redis with the new history (including user's message)
+        redis_client.set(chat_history_key, json.dumps(current_history))
+        return {"message": "Sohbet mesajı alındı ve işleniyor", "task_id": task.id}
 
-    return jsonify({"message": "Sohbet mesajı alındı ve işleniyor", "task_id": task.id}), 202
+    # Aynı mesajın tekrar gönderilmesi çalışan Gemini isteğine bağlanır
+    with metrics.stage("http.chat", video_id=video_id):
+        return _single_flight("chat", start, payload={"video_id": video_id, "message": user_message, "mode": mode})
 
-@app.route("/api/finalize", methods=["POST"])
+@api.route("/api/finalize", methods=["POST"])
 def finalize_video():
     data = request.json
     video_id = data.get("video_id")
     cuts = data.get("cuts")
+    profiles = data.get("profiles")
 
     if not video_id or not cuts:
         return jsonify({"error": "video_id and cuts are required"}), 400
 
+    # İsteğe bağlı çıktı profilleri; verilmezse stream copy ile tek çıktı üretilir
+    if profiles:
+        unknown_profiles = [p for p in profiles if p not in current_app.config["OUTPUT_PROFILES"]]
+        if unknown_profiles:
+            return jsonify({"error": f"Unknown output profiles: {', '.join(unknown_profiles)}",
+                            "available_profiles": list(current_app.config["OUTPUT_PROFILES"])}), 400
+
     # Retrieve the original video path. This is a simplification.
     # In a real application, you would store video metadata (including its path) in a database
     # or a more persistent storage solution associated with the video_id.
     # For now, we'll assume the video is in the UPLOAD_FOLDER and try to find it.
     # A more robust solution would be to pass the actual video_path from the upload step.
-    upload_folder = app.config["UPLOAD_FOLDER"]
-    video_files = [f for f in os.listdir(upload_folder) if f.startswith(video_id)]
-    if not video_files:
+    # Varsa analiz sırasında üretilen fast-start kopya kullanılır
+    original_video_path = media.find_video_path(current_app.config["UPLOAD_FOLDER"], video_id)
+    if not original_video_path:
         return jsonify({"error": "Original video not found for this video_id"}), 404
-    original_video_path = os.path.join(upload_folder, video_files[0])
 
-    output_filename = f"final_{video_id}.mp4"
-    output_path = os.path.join(app.config["PROCESSED_FOLDER"], output_filename)
+    def start():
+        # Her iş kendi dizinine yazar (processed/<job_id>/); eşzamanlı işler çakışmaz
+        job_id = str(uuid.uuid4())
+        output_filename = f"final_{video_id}.mp4"
+        output_path = os.path.join(current_app.config["PROCESSED_FOLDER"], job_id, output_filename)
 
-    from tasks import finalize_video_task
-    task = finalize_video_task.delay(original_video_path, output_path, cuts)
+        from tasks import finalize_video_task
+        finalize_video_task.apply_async((original_video_path, output_path, cuts, profiles), task_id=job_id)
+        return {"message": "Video sonlandırma görevi başlatıldı", "task_id": job_id, "output_path": output_path}
 
-    return jsonify({"message": "Video sonlandırma görevi başlatıldı", "task_id": task.id, "output_path": output_path}), 202
+    with metrics.stage("http.finalize", video_id=video_id):
+        return _single_flight("finalize", start, payload={"video_id": video_id, "cuts": cuts, "profiles": profiles})
+
+@api.route("/api/finalize/batch", methods=["POST"])
+def finalize_batch():
+    """Tek videodan birden çok isimli klibi tek görevde dışa aktarır"""
+    data = request.json
+    video_id = data.get("video_id")
+    clips = data.get("clips")
+
+    if not video_id or not clips:
+        return jsonify({"error": "video_id and clips are required"}), 400
+
+    from werkzeug.utils import secure_filename
+    normalized_clips = []
+    seen_names = set()
+    for i, clip in enumerate(clips):
+        name = secure_filename(str(clip.get("name") or f"clip_{i + 1}"))
+        if not name or name in seen_names:
+            return jsonify({"error": f"Invalid or duplicate clip name at index {i}"}), 400
+        if not clip.get("cuts"):
+            return jsonify({"error": f"Clip '{name}' has no cuts"}), 400
+        # Hatalı bir kesim klibin ffmpeg çalışmasını düşüreceğinden istek baştan reddedilir
+        for cut in clip["cuts"]:
+            try:
+                valid = planner.parse_timestamp(cut["start"]) < planner.parse_timestamp(cut["end"])
+            except (KeyError, TypeError, ValueError):
+                valid = False
+            if not valid:
+                return jsonify({"error": f"Clip '{name}' has an invalid cut: {cut}"}), 400
+        seen_names.add(name)
+        normalized_clips.append({"name": name, "cuts": clip["cuts"]})
+
+    # Varsa analiz sırasında üretilen fast-start kopya kullanılır
+    original_video_path = media.find_video_path(current_app.config["UPLOAD_FOLDER"], video_id)
+    if not original_video_path:
+        return jsonify({"error": "Original video not found for this video_id"}), 404
+
+    def start():
+        job_id = str(uuid.uuid4())
+        output_dir = os.path.join(current_app.config["PROCESSED_FOLDER"], job_id)
+
+        from tasks import batch_export_task
+        batch_export_task.apply_async((original_video_path, output_dir, normalized_clips), task_id=job_id)
+        return {"message": "Toplu dışa aktarma görevi başlatıldı", "task_id": job_id, "output_dir": output_dir}
+
+    with metrics.stage("http.finalize_batch", video_id=video_id):
+        return _single_flight("finalize_batch", start, payload={"video_id": video_id, "clips": normalized_clips})
+
+# --- Uygulama Fabrikası ---
+def create_app(config_object=Config):
+    """
+    Flask uygulamasını kurar ve ilk isteğin ödememesi için başlangıç işlerini
+    burada yapar: araç zinciri yoklanır, Celery/Redis içe aktarılıp bağlantı
+    havuzu ısıtılır, soğuk başlangıç süresi raporlanır.
+    """
+    factory_started = time.perf_counter()
+    app = Flask(__name__)
+    app.config.from_object(config_object) # Yapılandırmayı yükle
+    CORS(app) # Frontend'den gelen isteklere izin ver
+    app.register_blueprint(api)
 
-# --- Uygulamayı Çalıştırma ---
-if __name__ == '__main__':
-    # Gerekli klasörleri oluştur
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     os.makedirs(app.config['PROCESSED_FOLDER'], exist_ok=True)
+
+    app.config["TOOLCHAIN"] = startup.probe_toolchain()
+    # Görevleri kuyruğa koymak için tasks modülü gerekir (google.genai'yi yüklemez)
+    from tasks import get_redis_client
+    try:
+        get_redis_client().ping()
+    except Exception as e:
+        app.logger.warning(f"Redis'e bağlanılamadı: {e}")
+
+    startup.report_cold_start("api", "create_app", factory_started)
+    startup.report_cold_start("api", "total", PROCESS_STARTED)
+    return app
+
+app = create_app()
+
+# --- Uygulamayı Çalıştırma ---
+if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
 
@@ -0,0 +1,76 @@
+# backend/media.py
+# Yüklenen videoların fast-start MP4'e kayıpsız remux edilmesi ve
+# sonraki aşamaların kullanacağı dosya yolunun bulunması.
+import os
+import subprocess
+
+import metrics
+
+# Remux edilmiş kopyanın dosya adı son eki: <video_id>.faststart.mp4
+FASTSTART_SUFFIX = ".faststart.mp4"
+
+
+def faststart_path(upload_folder, video_id):
+    return os.path.join(upload_folder, f"{video_id}{FASTSTART_SUFFIX}")
+
+
+def remux_faststart(video_path, output_path):
+    """
+    Videoyu yeniden kodlamadan (stream copy) moov atomu başta olan bir MP4'e
+    taşır; tarayıcıda Range ile oynatma ve ffmpeg girdi seek'i dosyanın
+    sonunu okumak zorunda kalmaz. Başarılı olursa sonraki aşamaların hepsi
+    kopyayı kullandığından orijinal silinir (disk kullanımı iki katına çıkmaz).
+    Başarısız olursa None döner ve çağıran orijinal dosyayı kullanmaya devam eder.
+    """
+    temp_path = output_path + ".part"
+    cmd = [
+        "ffmpeg",
+        "-y",
+        "-i", video_path,
+        "-map", "0:v",
+        "-map", "0:a?",
+        "-c", "copy",
+        "-movflags", "+faststart",
+        "-f", "mp4",
+        temp_path
+    ]
+    try:
+        metrics.run_ffmpeg(cmd, "ingest.remux", check=True, capture_output=True)
+        os.replace(temp_path, output_path)
+    except (subprocess.CalledProcessError, OSError) as e:
+        stderr = e.stderr.decode(errors="replace") if getattr(e, "stderr", None) else e
+        print(f"Remux hatası, orijinal dosya kullanılacak: {stderr}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return None
+    try:
+        os.remove(video_path)
+    except OSError as e:
+        print(f"Uyarı: orijinal yükleme silinemedi: {e}")
+    return output_path
+
+
+def find_video_path(upload_folder, video_id):
+    """Varsa remux edilmiş kopyayı, yoksa orijinal yüklemeyi döndürür."""
+    remuxed = faststart_path(upload_folder, video_id)
+    if os.path.exists(remuxed):
+        return remuxed
+    video_files = sorted(
+        f for f in os.listdir(upload_folder)
+        if f.startswith(video_id) and not f.endswith((FASTSTART_SUFFIX, ".part"))
+    )
+    if not video_files:
+        return None
+    return os.path.join(upload_folder, video_files[0])
+
+
+def resolve_video_path(video_path):
+    """
+    Görev kuyruğa konduktan sonra orijinal yükleme remux edilip silinmiş
+    olabilir; bu durumda aynı video_id'nin fast-start kopyasını döndürür.
+    """
+    if os.path.exists(video_path):
+        return video_path
+    # Yükleme dosya adları "<video_id>_<orijinal ad>" biçimindedir
+    video_id = os.path.basename(video_path).split("_", 1)[0]
+    return find_video_path(os.path.dirname(video_path), video_id) or video_path
@@ -0,0 +1,291 @@
+# backend/metrics.py
+# Aşama bazlı Prometheus metrikleri ve (kuruluysa) OpenTelemetry izleri.
+# Hem Flask API'si hem de Celery worker'ları bu modülü kullanır. Worker ve API
+# ayrı süreçler olduğu için PROMETHEUS_MULTIPROC_DIR tanımlanırsa metrikler
+# bu dizin üzerinden birleştirilir ve /metrics uç noktasında tek seferde sunulur.
+import os
+import time
+import inspect
+import threading
+import subprocess
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# OpenTelemetry isteğe bağlıdır; kurulu değilse izler atlanır, metrikler çalışmaya devam eder
+try:
+    from opentelemetry import context as otel_context
+    from opentelemetry import propagate, trace
+    tracer = trace.get_tracer("aicutter")
+except ImportError:
+    otel_context = None
+    propagate = None
+    trace = None
+    tracer = None
+
+STAGE_SECONDS = Histogram(
+    "aicutter_stage_duration_seconds",
+    "İşlem aşamalarının süresi (saniye)",
+    ["stage"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+STAGE_ERRORS = Counter(
+    "aicutter_stage_errors_total",
+    "Hata ile sonuçlanan aşama sayısı",
+    ["stage"],
+)
+GEMINI_UPLOAD_BYTES = Counter(
+    "aicutter_gemini_upload_bytes_total",
+    "Gemini Files API'ye yüklenen toplam bayt",
+)
+CACHE_REQUESTS = Counter(
+    "aicutter_cache_requests_total",
+    "Önbellek erişimleri (hit/miss)",
+    ["cache", "result"],
+)
+FFMPEG_WALL_SECONDS = Histogram(
+    "aicutter_ffmpeg_wall_seconds",
+    "ffmpeg/ffprobe çağrılarının duvar saati süresi",
+    ["stage"],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+FFMPEG_CPU_SECONDS = Histogram(
+    "aicutter_ffmpeg_cpu_seconds",
+    "ffmpeg/ffprobe çağrılarının kullanıcı+sistem CPU süresi",
+    ["stage"],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+GEMINI_PROMPT_TOKENS = Histogram(
+    "aicutter_gemini_prompt_tokens",
+    "Gemini isteği başına planlanan (expected) ve gerçekleşen (actual) girdi tokenı",
+    ["kind"],
+    buckets=(1000, 5000, 10000, 50000, 100000, 250000, 500000, 1000000, 2000000),
+)
+COLD_START_SECONDS = Gauge(
+    "aicutter_cold_start_seconds",
+    "Sürecin başlangıcından isteğe/göreve hazır olana kadar geçen süre",
+    ["process", "phase"],
+    multiprocess_mode="liveall",
+)
+TOOLCHAIN_AVAILABLE = Gauge(
+    "aicutter_toolchain_available",
+    "Başlangıçta bulunan ffmpeg/ffprobe ikilileri ve kodlayıcıları (1: var, 0: yok)",
+    ["component"],
+    multiprocess_mode="liveall",
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "aicutter_celery_queue_wait_seconds",
+    "Görevin kuyruğa girmesinden worker'da başlamasına kadar geçen süre",
+    ["queue", "task"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300),
+)
+QUEUE_DEPTH = Gauge(
+    "aicutter_celery_queue_depth",
+    "Celery kuyruğunda bekleyen mesaj sayısı",
+    ["queue"],
+    multiprocess_mode="mostrecent",
+)
+
+# Yayın zamanı ve video kimliği için Celery mesaj başlıkları
+PUBLISHED_AT_HEADER = "x_published_at"
+VIDEO_ID_HEADER = "x_video_id"
+
+# Geçerli istek/görevin video_id'si; kuyruğa konan görevlere başlıkla aktarılır
+_current_video_id = ContextVar("aicutter_video_id", default=None)
+
+# task_id -> (span, context token); prerun'da açılan izler postrun'da kapatılır
+_task_spans = {}
+
+
+@contextmanager
+def stage(name, **attributes):
+    """
+    Bir işlem aşamasını ölçer: süreyi histograma yazar, hataları sayar ve
+    OpenTelemetry kuruluysa video_id/task_id gibi niteliklerle bir iz açar.
+    """
+    start = time.perf_counter()
+    span_cm = tracer.start_as_current_span(name) if tracer else nullcontext()
+    # Aşama içinde set_video_id ile yapılan değişiklikler de çıkışta geri alınır
+    token = _current_video_id.set(attributes.get("video_id") or _current_video_id.get())
+    with span_cm as span:
+        if span is not None:
+            for key, value in attributes.items():
+                if value is not None:
+                    span.set_attribute(key, str(value))
+        try:
+            yield span
+        except BaseException:
+            STAGE_ERRORS.labels(stage=name).inc()
+            raise
+        finally:
+            STAGE_SECONDS.labels(stage=name).observe(time.perf_counter() - start)
+            _current_video_id.reset(token)
+
+
+def set_video_id(video_id):
+    """
+    Aşama açıldıktan sonra öğrenilen video_id'yi (örn. yüklemede üretilen)
+    geçerli ize ve sonradan kuyruğa konacak görevlere ekler.
+    """
+    _current_video_id.set(video_id)
+    if trace is not None:
+        trace.get_current_span().set_attribute("video_id", str(video_id))
+
+
+def _run_with_rusage(cmd, capture_output=False, text=False, **kwargs):
+    """
+    subprocess.run benzeri çalıştırır ancak çocuğu os.wait4 ile bekler; böylece
+    CPU süresi yalnızca bu sürece aittir (RUSAGE_CHILDREN süreç genelidir ve
+    çok iş parçacıklı sunucuda eşzamanlı ffmpeg'leri birbirine karıştırır).
+    """
+    if capture_output:
+        kwargs["stdout"] = kwargs["stderr"] = subprocess.PIPE
+    process = subprocess.Popen(cmd, text=text, **kwargs)
+    outputs = {"stdout": None, "stderr": None}
+    readers = []
+    for name in outputs:
+        stream = getattr(process, name)
+        if stream is not None:
+            reader = threading.Thread(target=lambda n=name, s=stream: outputs.__setitem__(n, s.read()), daemon=True)
+            reader.start()
+            readers.append(reader)
+    _, status, rusage = os.wait4(process.pid, 0)
+    # Popen'ın çocuğu tekrar beklememesi için dönüş kodunu elle işaretle
+    process.returncode = os.waitstatus_to_exitcode(status)
+    for reader in readers:
+        reader.join()
+    for stream in (process.stdout, process.stderr):
+        if stream is not None:
+            stream.close()
+
+    result = subprocess.CompletedProcess(process.args, process.returncode, outputs["stdout"], outputs["stderr"])
+    return result, rusage.ru_utime + rusage.ru_stime
+
+
+def run_ffmpeg(cmd, stage_name, **kwargs):
+    """
+    subprocess.run sarmalayıcısı; ffmpeg/ffprobe için duvar saati ve çocuk
+    sürecin kendi CPU süresini (os.wait4 rusage) kaydeder.
+    """
+    check = kwargs.pop("check", False)
+    start = time.perf_counter()
+    with stage(stage_name, command=cmd[0]):
+        try:
+            result, cpu = _run_with_rusage(cmd, **kwargs)
+        finally:
+            FFMPEG_WALL_SECONDS.labels(stage=stage_name).observe(time.perf_counter() - start)
+        FFMPEG_CPU_SECONDS.labels(stage=stage_name).observe(cpu)
+        if check:
+            result.check_returncode()
+        return result
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+def record_gemini_upload(path):
+    try:
+        GEMINI_UPLOAD_BYTES.inc(os.path.getsize(path))
+    except OSError:
+        pass
+
+
+def record_gemini_tokens(expected, actual):
+    GEMINI_PROMPT_TOKENS.labels(kind="expected").observe(expected)
+    if actual is not None:
+        GEMINI_PROMPT_TOKENS.labels(kind="actual").observe(actual)
+
+
+def update_queue_depths(redis_client, queues):
+    """Redis broker'daki kuyruk uzunluklarını okur (her /metrics isteğinde)."""
+    for queue in queues:
+        try:
+            QUEUE_DEPTH.labels(queue=queue).set(redis_client.llen(queue))
+        except Exception:
+            pass
+
+
+def render_metrics():
+    """/metrics yanıt gövdesini ve içerik türünü döndürür."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+# --- Celery sinyalleri: kuyruk bekleme süresi ve iz bağlamının taşınması ---
+
+def _on_before_task_publish(sender=None, headers=None, routing_key=None, **kwargs):
+    if headers is None:
+        return
+    headers[PUBLISHED_AT_HEADER] = time.time()
+    video_id = _current_video_id.get()
+    if video_id:
+        headers[VIDEO_ID_HEADER] = video_id
+    if propagate is not None:
+        # HTTP isteğindeki iz bağlamını worker'a taşı
+        propagate.inject(headers)
+
+
+def _task_video_id(task, args, kwargs):
+    """Görevin video_id'sini mesaj başlığından ya da video_id parametresinden bulur."""
+    video_id = getattr(task.request, VIDEO_ID_HEADER, None)
+    if video_id:
+        return video_id
+    try:
+        return inspect.signature(task.run).bind_partial(*(args or ()), **(kwargs or {})).arguments.get("video_id")
+    except TypeError:
+        return None
+
+
+def _on_task_prerun(task_id=None, task=None, args=None, kwargs=None, **extra):
+    request = task.request
+    video_id = _task_video_id(task, args, kwargs)
+    # Görevin içinden kuyruğa konan alt görevler (örn. chord pencereleri) aynı video_id'yi taşır
+    _current_video_id.set(video_id)
+    queue = (request.delivery_info or {}).get("routing_key") or "celery"
+    published_at = getattr(request, PUBLISHED_AT_HEADER, None)
+    if published_at is not None:
+        QUEUE_WAIT_SECONDS.labels(queue=queue, task=task.name).observe(max(time.time() - float(published_at), 0.0))
+
+    if tracer is None:
+        return
+    carrier = {key: getattr(request, key) for key in ("traceparent", "tracestate") if getattr(request, key, None)}
+    parent = propagate.extract(carrier)
+    span = tracer.start_span(task.name, context=parent)
+    span.set_attribute("celery.task_id", task_id)
+    span.set_attribute("celery.queue", queue)
+    if video_id:
+        span.set_attribute("video_id", str(video_id))
+    token = otel_context.attach(trace.set_span_in_context(span, parent))
+    _task_spans[task_id] = (span, token)
+
+
+def _on_task_postrun(task_id=None, state=None, **kwargs):
+    entry = _task_spans.pop(task_id, None)
+    if entry is None:
+        return
+    span, token = entry
+    if state:
+        span.set_attribute("celery.state", state)
+    otel_context.detach(token)
+    span.end()
+
+
+def install_celery_hooks():
+    """Celery sinyal dinleyicilerini bağlar; hem yayınlayan hem worker süreçlerinde çağrılır."""
+    from celery.signals import before_task_publish, task_postrun, task_prerun
+    before_task_publish.connect(_on_before_task_publish, weak=False)
+    task_prerun.connect(_on_task_prerun, weak=False)
+    task_postrun.connect(_on_task_postrun, weak=False)
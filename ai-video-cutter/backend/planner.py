@@ -0,0 +1,191 @@
+# backend/planner.py
+# Gemini video istekleri için uyarlamalı kare örnekleme planlayıcısı.
+# Video süresi, token bütçesi ve kullanıcının sorduğu zaman aralığına göre
+# VideoMetadata fps/start_offset/end_offset ve medya çözünürlüğünü seçer.
+import re
+
+# Gemini belgelerindeki yaklaşık token maliyetleri
+TOKENS_PER_FRAME = {"default": 258, "low": 66}
+AUDIO_TOKENS_PER_SECOND = 32
+# Metin için kaba tahmin: yaklaşık 4 karakter = 1 token
+CHARS_PER_TEXT_TOKEN = 4
+# Denenecek fps değerleri (büyükten küçüğe)
+FPS_CANDIDATES = (15, 10, 5, 2, 1, 0.5, 0.25, 0.1)
+
+_UNITS = {
+    "saniye": 1, "sn": 1, "second": 1, "seconds": 1, "sec": 1, "secs": 1, "s": 1,
+    "dakika": 60, "dk": 60, "minute": 60, "minutes": 60, "min": 60, "mins": 60, "m": 60,
+    "saat": 3600, "hour": 3600, "hours": 3600, "h": 3600,
+}
+# Yalnızca Türkçe tam birim adları ek alabilir ("dakikada", "saati"); diğerleri
+# kelime sınırı ister, böylece "3 sections" saniye olarak okunmaz
+_SUFFIXED_UNITS = ("saniye", "dakika", "saat")
+_UNIT_PATTERN = (
+    "|".join(sorted(_SUFFIXED_UNITS, key=len, reverse=True))
+    + "|(?:" + "|".join(sorted((u for u in _UNITS if u not in _SUFFIXED_UNITS), key=len, reverse=True)) + r")\b"
+)
+_TIMESTAMP = r"\d+(?::\d{1,2}){0,2}(?:\.\d+)?"
+
+# Anahtar kelimeler de kelime sınırı ister ("person", "semifinal", "lesson" eşleşmez)
+_LAST_RE = re.compile(rf"\b(?:son|last|final)\s+(\d+(?:[.,]\d+)?)\s*({_UNIT_PATTERN})", re.IGNORECASE)
+_FIRST_RE = re.compile(rf"\b(?:ilk|first|opening)\s+(\d+(?:[.,]\d+)?)\s*({_UNIT_PATTERN})", re.IGNORECASE)
+_RANGE_RE = re.compile(rf"({_TIMESTAMP})\s*(?:-|–|ile|to|and|until|ve)\s*({_TIMESTAMP})", re.IGNORECASE)
+
+
+def parse_timestamp(value):
+    """
+    "SS", "MM:SS", "HH:MM:SS" (ondalıklı saniye dahil) veya sayı biçimindeki
+    zaman damgasını saniyeye çevirir.
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    seconds = 0.0
+    for part in str(value).strip().split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def format_timestamp(seconds):
+    """Saniyeyi "HH:MM:SS" biçimine çevirir."""
+    seconds = int(round(seconds))
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def parse_time_range(message, duration):
+    """
+    Mesajdaki "son 5 dakika", "first 2 minutes", "01:00 - 02:30" gibi
+    ifadelerden (başlangıç, bitiş) saniye aralığı çıkarır; yoksa None döner.
+    """
+    match = _LAST_RE.search(message)
+    if match:
+        span = float(match.group(1).replace(",", ".")) * _UNITS[match.group(2).lower()]
+        return max(duration - span, 0.0), duration
+    match = _FIRST_RE.search(message)
+    if match:
+        span = float(match.group(1).replace(",", ".")) * _UNITS[match.group(2).lower()]
+        return 0.0, min(span, duration)
+    match = _RANGE_RE.search(message)
+    if match and (":" in match.group(1) or ":" in match.group(2)):
+        start, end = parse_timestamp(match.group(1)), parse_timestamp(match.group(2))
+        if start < end:
+            return min(start, duration), min(end, duration)
+    return None
+
+
+def estimate_tokens(seconds, fps, resolution="default"):
+    """Video (kare + ses) tokenı tahmini."""
+    return int(seconds * (fps * TOKENS_PER_FRAME[resolution] + AUDIO_TOKENS_PER_SECOND))
+
+
+def estimate_text_tokens(text):
+    return (len(text) + CHARS_PER_TEXT_TOKEN - 1) // CHARS_PER_TEXT_TOKEN
+
+
+def plan_sampling(duration, user_message, token_budget, max_fps=15, prompt_text=None):
+    """
+    Bütçeye sığan en yüksek fps'i seçer; her fps için önce varsayılan, sonra
+    düşük çözünürlük denenir (zamansal kapsama çözünürlükten önceliklidir).
+    Hiçbiri sığmazsa en düşük fps ve düşük çözünürlük kullanılır.
+
+    prompt_text, isteğe giden tüm metindir (sistem promptu + mesaj); tokenları
+    bütçeden düşülür ve expected_tokens'a eklenir, böylece gerçekleşen
+    prompt_token_count ile doğrudan karşılaştırılabilir.
+    """
+    time_range = parse_time_range(user_message, duration)
+    start, end = time_range if time_range else (0.0, duration)
+    seconds = max(end - start, 1.0)
+    text_tokens = estimate_text_tokens(prompt_text if prompt_text is not None else user_message)
+    video_budget = token_budget - text_tokens
+
+    plan = None
+    for fps in FPS_CANDIDATES:
+        if fps > max_fps:
+            continue
+        for resolution in ("default", "low"):
+            if estimate_tokens(seconds, fps, resolution) <= video_budget:
+                plan = {"fps": fps, "media_resolution": resolution}
+                break
+        if plan:
+            break
+    if plan is None:
+        plan = {"fps": FPS_CANDIDATES[-1], "media_resolution": "low"}
+
+    video_tokens = estimate_tokens(seconds, plan["fps"], plan["media_resolution"])
+    plan.update({
+        "start_offset": start if time_range else None,
+        "end_offset": end if time_range else None,
+        "expected_video_tokens": video_tokens,
+        "expected_text_tokens": text_tokens,
+        "expected_tokens": video_tokens + text_tokens,
+        "token_budget": token_budget,
+    })
+    return plan
+
+
+def plan_windows(duration, window_seconds, overlap_seconds):
+    """
+    Uzun videoyu birbiriyle örtüşen [başlangıç, bitiş] pencerelerine böler.
+    Video tek pencereye sığıyorsa tek bir pencere döner; örtüşme süresinden
+    kısa kalan son parça önceki pencereye eklenir.
+    """
+    if duration <= window_seconds:
+        return [(0.0, float(duration))]
+    step = max(window_seconds - overlap_seconds, 1.0)
+    windows = []
+    start = 0.0
+    while start < duration:
+        end = min(start + window_seconds, duration)
+        # Örtüşmeden kısa bir kuyruk için ayrı (tam maliyetli) pencere açma, bu pencereye kat
+        if duration - end <= overlap_seconds:
+            end = duration
+        windows.append((start, end))
+        if end >= duration:
+            break
+        start += step
+    return windows
+
+
+def merge_cuts(cuts):
+    """
+    Mutlak saniye cinsinden (start, end) kesimlerini sıralar ve pencere
+    örtüşmelerinden gelen, gerçekten kesişen kesimleri tek kesimde birleştirir.
+    Yalnızca uç uca değen ya da arada boşluk olan kesimler ayrı kalır.
+    """
+    merged = []
+    for start, end in sorted(cuts):
+        if merged and start < merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def range_prompt(start, end):
+    """
+    Modele videonun yalnızca [start, end] aralığının gösterildiğini ve zaman
+    damgalarını bu aralığa göre vermesi gerektiğini anlatan prompt metni.
+    Yanıttaki kesimler to_absolute_cuts ile mutlak saniyelere çevrilir.
+    """
+    return (
+        f"Sana videonun yalnızca {format_timestamp(start)} - {format_timestamp(end)} aralığı gösteriliyor. "
+        "Zaman damgalarını bu aralığın başlangıcına göre (00:00:00 aralık başı olacak şekilde) ver; "
+        f"aralık uzunluğu {end - start:.1f} saniyedir."
+    )
+
+
+def to_absolute_cuts(cuts, range_start, range_end):
+    """
+    Aralık başına göreli {"start", "end"} kesimlerini mutlak (start, end)
+    saniyelerine çevirir; aralık dışına taşanları kırpar, geçersizleri atlar.
+    """
+    absolute_cuts = []
+    for cut in cuts:
+        try:
+            start = range_start + parse_timestamp(cut["start"])
+            end = range_start + parse_timestamp(cut["end"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        start, end = max(start, range_start), min(end, range_end)
+        if start < end:
+            absolute_cuts.append((start, end))
+    return absolute_cuts
@@ -0,0 +1,63 @@
+# backend/startup.py
+# API ve worker süreçleri için başlangıç (warm start) yaşam döngüsü:
+# ffmpeg/ffprobe araç zinciri bir kez yoklanır, istemciler önceden hazırlanır
+# ve her sürecin soğuk başlangıç süresi ölçülüp raporlanır.
+import shutil
+import subprocess
+import time
+
+import metrics
+
+# Profillerde kullanılan ve başlangıçta varlığı kontrol edilen kodlayıcılar
+REQUIRED_ENCODERS = ("libx264", "aac")
+
+# Yoklama sonucu; süreç başına bir kez doldurulur
+TOOLCHAIN = {}
+
+
+def probe_toolchain():
+    """
+    ffmpeg/ffprobe ikililerini, sürümlerini ve gerekli kodlayıcıları bir kez
+    kontrol eder; eksikler loglanır ve metrik olarak yayınlanır.
+    """
+    if TOOLCHAIN:
+        return TOOLCHAIN
+    for binary in ("ffmpeg", "ffprobe"):
+        path = shutil.which(binary)
+        version = None
+        if path:
+            try:
+                result = subprocess.run([path, "-hide_banner", "-version"], capture_output=True, text=True, check=True)
+                version = result.stdout.splitlines()[0] if result.stdout else None
+            except (subprocess.CalledProcessError, OSError):
+                path = None
+        TOOLCHAIN[binary] = {"path": path, "version": version}
+        metrics.TOOLCHAIN_AVAILABLE.labels(component=binary).set(1 if path else 0)
+        if not path:
+            print(f"Uyarı: {binary} bulunamadı, video işlemleri başarısız olacak.")
+
+    encoders = set()
+    if TOOLCHAIN["ffmpeg"]["path"]:
+        try:
+            result = subprocess.run([TOOLCHAIN["ffmpeg"]["path"], "-hide_banner", "-encoders"],
+                                    capture_output=True, text=True, check=True)
+            for line in result.stdout.splitlines():
+                parts = line.split()
+                if len(parts) >= 2 and len(parts[0]) == 6:
+                    encoders.add(parts[1])
+        except (subprocess.CalledProcessError, OSError):
+            pass
+    TOOLCHAIN["encoders"] = {name: name in encoders for name in REQUIRED_ENCODERS}
+    for name, available in TOOLCHAIN["encoders"].items():
+        metrics.TOOLCHAIN_AVAILABLE.labels(component=f"encoder:{name}").set(1 if available else 0)
+        if not available:
+            print(f"Uyarı: ffmpeg '{name}' kodlayıcısını desteklemiyor, yeniden kodlama profilleri çalışmayabilir.")
+    return TOOLCHAIN
+
+
+def report_cold_start(process, phase, started_at):
+    """time.perf_counter() ile alınmış başlangıçtan bu yana geçen süreyi raporlar."""
+    elapsed = time.perf_counter() - started_at
+    metrics.COLD_START_SECONDS.labels(process=process, phase=phase).set(elapsed)
+    print(f"Soğuk başlangıç ({process}/{phase}): {elapsed:.3f} saniye")
+    return elapsed
@@ -1,11 +1,18 @@
-from celery import Celery
+import time
+PROCESS_STARTED = time.perf_counter() # Soğuk başlangıç ölçümü için
+from celery import Celery, chord
+from celery.signals import worker_process_init, worker_ready
 from config import Config
 import os
 import subprocess # FFmpeg için
 import json # Gemini yanıtını işlemek için
 import redis # Konuşma geçmişi için
-from google import genai
-from google.genai import types
+import metrics
+import media
+import planner
+import startup
+# google.genai yalnızca worker'da gerekir; görev kuyruğa koyan web süreçleri
+# bu modülü içe aktardığında yüklenmemesi için fonksiyon içinde içe aktarılır.
 
 # Celery uygulamasını başlat
 celery_app = Celery(
@@ -22,8 +29,17 @@ celery_app.conf.update(
     enable_utc=True,
 )
 
-# Redis istemcisini başlat
-redis_client = redis.from_url(Config.REDIS_URL)
+# Kuyruk bekleme süresi ve iz bağlamı için Celery sinyallerini bağla
+metrics.install_celery_hooks()
+
+# Redis istemcisi - Lazy initialization (ilk kullanımda ya da worker_process_init'te)
+redis_client = None
+
+def get_redis_client():
+    global redis_client
+    if redis_client is None:
+        redis_client = redis.from_url(Config.REDIS_URL)
+    return redis_client
 
 # Gemini istemcisini başlat - Lazy initialization
 gemini_client = None
@@ -31,9 +47,46 @@ gemini_client = None
 def get_gemini_client():
     global gemini_client
     if gemini_client is None:
+        from google import genai
         gemini_client = genai.GenerativeModel(model_name=Config.GEMINI_MODEL)
     return gemini_client
 
+# google-genai Files API / generate_content istemcisi - Lazy initialization
+genai_client = None
+
+def get_genai_client():
+    global genai_client
+    if genai_client is None:
+        from google import genai
+        genai_client = genai.Client(api_key=Config.GEMINI_API_KEY)
+    return genai_client
+
+
+@worker_process_init.connect
+def warm_worker_process(**kwargs):
+    """
+    Her worker süreci başladığında ağır içe aktarmaları ve istemcileri önceden
+    hazırlar, böylece ilk görev bu maliyeti ödemez.
+    """
+    init_started = time.perf_counter()
+    startup.probe_toolchain()
+    try:
+        get_redis_client().ping()
+    except redis.RedisError as e:
+        print(f"Uyarı: Redis'e bağlanılamadı: {e}")
+    try:
+        from google.genai import types  # noqa: F401 - içe aktarma maliyetini önceden öde
+        get_genai_client()
+    except Exception as e:
+        print(f"Uyarı: Gemini istemcisi hazırlanamadı: {e}")
+    # prefork'ta PROCESS_STARTED ana süreçte alınmıştır; çocuk yalnızca kendi hazırlığını raporlar
+    startup.report_cold_start("worker", "process_init", init_started)
+
+@worker_ready.connect
+def report_worker_ready(**kwargs):
+    """Ana worker süreci görev almaya hazır olduğunda toplam açılış süresini bir kez raporlar."""
+    startup.report_cold_start("worker", "total", PROCESS_STARTED)
+
 # --- Celery Görevleri Tanımlamaları ---
 
 @celery_app.task(name='tasks.analyze_video')
@@ -52,11 +105,18 @@ def analyze_video(video_path, video_id):
             '-of', 'default=noprint_wrappers=1:nokey=1',
             video_path
         ]
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        with metrics.stage("analyze", video_id=video_id):
+            result = metrics.run_ffmpeg(cmd, "analyze.ffprobe", capture_output=True, text=True, check=True)
         duration = float(result.stdout.strip())
         print(f"Video süresi: {duration} saniye")
 
-        return {"status": "success", "duration": duration}
+        # Sonraki aşamalar (oynatma, kesme) hızlı seek için remux edilmiş kopyayı kullanır
+        if Config.REMUX_UPLOADS:
+            remuxed_path = media.remux_faststart(video_path, media.faststart_path(os.path.dirname(video_path), video_id))
+            if remuxed_path:
+                video_path = remuxed_path
+
+        return {"status": "success", "duration": duration, "video_path": video_path}
 
     except subprocess.CalledProcessError as e:
         print(f"FFprobe hatası: {e}")
@@ -72,6 +132,7 @@ def process_chat_command(video_path, video_id, user_message, current_history):
     Kullanıcı mesajını ve geçmişi alıp Gemini'ye gönderir, kesim önerilerini döndürür.
     """
     print(f"Sohbet komut işleme görevi başladı: {video_id}")
+    from google.genai import types
     try:
         # Sohbet geçmişini Gemini formatına dönüştür
         formatted_history = []
@@ -92,8 +153,9 @@ def process_chat_command(video_path, video_id, user_message, current_history):
 
         # Gemini'ye istek gönder
         model = get_gemini_client()
-        chat_session = model.start_chat(history=formatted_history)
-        response = chat_session.send_message(user_message)
+        with metrics.stage("gemini.generate_content", video_id=video_id):
+            chat_session = model.start_chat(history=formatted_history)
+            response = chat_session.send_message(user_message)
 
         # Gemini yanıtını işle
         ai_message = response.text
@@ -117,7 +179,7 @@ def process_chat_command(video_path, video_id, user_message, current_history):
         current_history.append({"role": "model", "parts": [{"text": ai_message}]})
         
         # Redis'te geçmişi güncelle
-        redis_client.set(Config.REDIS_CHAT_HISTORY_KEY.format(video_id), json.dumps(current_history))
+        get_redis_client().set(Config.REDIS_CHAT_HISTORY_KEY.format(video_id), json.dumps(current_history))
 
         return {"status": "success", "cuts": cuts, "ai_message": ai_message}
 
@@ -126,16 +188,21 @@ def process_chat_command(video_path, video_id, user_message, current_history):
         ai_message = f"Beklenmedik bir hata oluştu: {e}"
         current_history.append({"role": "user", "parts": [{"text": user_message}]})
         current_history.append({"role": "model", "parts": [{"text": ai_message}]})
-        redis_client.set(Config.REDIS_CHAT_HISTORY_KEY.format(video_id), json.dumps(current_history))
+        get_redis_client().set(Config.REDIS_CHAT_HISTORY_KEY.format(video_id), json.dumps(current_history))
         return {"status": "error", "message": ai_message, "cuts": []}
 
 
 @celery_app.task(name='tasks.finalize_video_task')
-def finalize_video_task(video_path, output_path, cuts):
+def finalize_video_task(video_path, output_path, cuts, profiles=None):
     """
     Verilen kesimlere göre videoyu FFmpeg ile keser ve birleştirir.
+    profiles verilirse (Config.OUTPUT_PROFILES isimleri) stream copy yerine
+    her profil tek bir decode üzerinden yeniden kodlanır.
     """
     print(f"Video sonlandırma görevi başladı: {video_path}")
+    video_path = media.resolve_video_path(video_path)
+    if profiles:
+        return _render_profiles(video_path, output_path, cuts, profiles)
     try:
         # FFmpeg komutunu oluştur
         # Karmaşık filtre grafiği kullanılarak birden fazla kesim birleştirilebilir.
@@ -162,7 +229,7 @@ def finalize_video_task(video_path, output_path, cuts):
                 "-c", "copy",
                 segment_output_path
             ]
-            subprocess.run(cmd, check=True, capture_output=True)
+            metrics.run_ffmpeg(cmd, "finalize.segment", check=True, capture_output=True)
             segment_files.append(segment_output_path)
 
         # Segmentleri birleştir
@@ -181,7 +248,7 @@ def finalize_video_task(video_path, output_path, cuts):
                 "-c", "copy",
                 output_path
             ]
-            subprocess.run(concat_cmd, check=True, capture_output=True)
+            metrics.run_ffmpeg(concat_cmd, "finalize.concat", check=True, capture_output=True)
         elif len(segment_files) == 1:
             os.rename(segment_files[0], output_path)
         else:
@@ -204,4 +271,351 @@ def finalize_video_task(video_path, output_path, cuts):
         return {"status": "error", "message": f"Beklenmedik hata: {e}"}
 
 
+def _has_audio(video_path):
+    """Videoda ses akışı olup olmadığını ffprobe ile kontrol eder."""
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'a',
+        '-show_entries', 'stream=index',
+        '-of', 'csv=p=0',
+        video_path
+    ]
+    # Bayt çıktısı: hata durumunda _render_profiles stderr'i decode edebilsin
+    result = metrics.run_ffmpeg(cmd, "finalize.ffprobe", capture_output=True, check=True)
+    return bool(result.stdout.strip())
+
+
+def _profile_video_filter(profile):
+    """Profilin çözünürlük ve kırpma/sığdırma ayarından ölçekleme filtresini üretir."""
+    width, height = profile["width"], profile["height"]
+    if profile.get("fit") == "crop":
+        return f"scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},setsar=1"
+    return (
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1"
+    )
+
+
+def _render_profiles(video_path, output_path, cuts, profile_names):
+    """
+    Kesimleri concat ile birleştirip split/asplit ile her profile dağıtan
+    tek bir filtre grafiği kurar; birleşik akış bir kez decode edilir, her
+    profil kendi çözünürlüğü, kodlayıcısı ve iş parçacığı bütçesiyle kodlanır.
+    batch_export_task'taki gibi her kesim kendi girdi tarafı -ss/-to seek'iyle
+    ayrı bir girdi olarak açılır; yalnızca kesim aralıkları decode edilir ve
+    sırasız kesimler için concat'in decode edilmiş kareleri bekletmesi gerekmez.
+    """
+    try:
+        profiles = {name: Config.OUTPUT_PROFILES[name] for name in profile_names}
+        has_audio = _has_audio(video_path)
+
+        input_args = []
+        concat_inputs = ""
+        for i, cut in enumerate(cuts):
+            input_args += ["-ss", str(cut["start"]), "-to", str(cut["end"]), "-i", video_path]
+            concat_inputs += f"[{i}:v:0]" + (f"[{i}:a:0]" if has_audio else "")
+        filters = [f"{concat_inputs}concat=n={len(cuts)}:v=1:a={1 if has_audio else 0}[vcat]" + ("[acat]" if has_audio else "")]
+
+        count = len(profiles)
+        filters.append("[vcat]split=" + str(count) + "".join(f"[vs{j}]" for j in range(count)))
+        if has_audio:
+            filters.append("[acat]asplit=" + str(count) + "".join(f"[as{j}]" for j in range(count)))
+
+        base, ext = os.path.splitext(output_path)
+        outputs = {}
+        output_args = []
+        for j, (name, profile) in enumerate(profiles.items()):
+            filters.append(f"[vs{j}]{_profile_video_filter(profile)}[vout{j}]")
+            profile_output_path = f"{base}_{name}{ext}"
+            output_args += [
+                "-map", f"[vout{j}]",
+                "-c:v", profile.get("vcodec", "libx264"),
+                "-crf", str(profile.get("crf", 23)),
+                "-preset", profile.get("preset", "medium"),
+                "-threads", str(profile.get("threads", 0)),
+            ]
+            if has_audio:
+                output_args += [
+                    "-map", f"[as{j}]",
+                    "-c:a", profile.get("acodec", "aac"),
+                    "-b:a", profile.get("audio_bitrate", "128k"),
+                ]
+            output_args += ["-movflags", "+faststart", profile_output_path]
+            outputs[name] = profile_output_path
+
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        cmd = ["ffmpeg", "-y"] + input_args + ["-filter_complex", ";".join(filters)] + output_args
+        metrics.run_ffmpeg(cmd, "finalize.render", check=True, capture_output=True)
+
+        print(f"Video sonlandırma tamamlandı: {outputs}")
+        return {"status": "success", "output_path": next(iter(outputs.values())), "outputs": outputs}
+
+    except subprocess.CalledProcessError as e:
+        print(f"FFmpeg hatası: {e.stderr.decode()}")
+        return {"status": "error", "message": f"Video işleme hatası: {e.stderr.decode()}"}
+    except Exception as e:
+        print(f"Beklenmedik sonlandırma hatası: {e}")
+        return {"status": "error", "message": f"Beklenmedik hata: {e}"}
+
+
+def _concat_segments(segment_files, output_path, temp_dir, stage_name):
+    """Segment dosyalarını stream copy ile tek çıktıda birleştirir."""
+    if len(segment_files) == 1:
+        os.replace(segment_files[0], output_path)
+        return
+    concat_list_path = os.path.join(temp_dir, f"concat_{os.path.basename(output_path)}.txt")
+    with open(concat_list_path, "w") as f:
+        for segment_file in segment_files:
+            f.write(f"file \'{segment_file}\'\n")
+    concat_cmd = [
+        "ffmpeg",
+        "-y",
+        "-f", "concat",
+        "-safe", "0",
+        "-i", concat_list_path,
+        "-c", "copy",
+        output_path
+    ]
+    metrics.run_ffmpeg(concat_cmd, stage_name, check=True, capture_output=True)
+    for segment_file in segment_files:
+        os.remove(segment_file)
+    os.remove(concat_list_path)
+
+
+@celery_app.task(bind=True, name='tasks.batch_export_task')
+def batch_export_task(self, video_path, output_dir, clips):
+    """
+    Tek kaynaktan birden çok isimli klibi tek görevde üretir.
+
+    Her klip için bir ffmpeg süreci çalışır; klibin her kesimi kendi girdi
+    tarafı -ss/-to seek'iyle ayrı bir girdi olarak açılır ve yalnızca kendi
+    aralığını okur. Bu, finalize_video_task ile aynı davranıştır (stream
+    copy'de başlangıç önceki anahtar kareye yaslanır, ses ve görüntü senkron
+    kalır); çıktı tarafı seek ise başı anahtar kareye kadar kırpıp sesi
+    kaydırırdı. Ardından klibin segmentleri birleştirilir ve sonuçlar
+    manifest.json dosyasına da yazılır.
+
+    İlerleme klip bazlıdır: her klip sırayla "cutting", "concatenating" ve
+    "done"/"error" olur; hatalı bir klip diğerlerini durdurmaz.
+    """
+    print(f"Toplu dışa aktarma görevi başladı: {video_path} ({len(clips)} klip)")
+    video_path = media.resolve_video_path(video_path)
+    clip_states = {clip["name"]: "pending" for clip in clips}
+
+    def report(status):
+        self.update_state(state="PROGRESS", meta={"status": status, "clips": dict(clip_states)})
+
+    try:
+        temp_dir = os.path.join(output_dir, "temp_segments")
+        os.makedirs(temp_dir, exist_ok=True)
+
+        results = []
+        for clip_index, clip in enumerate(clips):
+            name = clip["name"]
+            output_path = os.path.join(output_dir, f"{name}.mp4")
+            try:
+                # Her kesim için girdi tarafı seek'li ayrı bir girdi ve ona eşlenen bir çıktı
+                input_args = []
+                output_args = []
+                segments = []
+                for cut_index, cut in enumerate(clip["cuts"]):
+                    segment_output_path = os.path.join(temp_dir, f"clip_{clip_index}_segment_{cut_index}.mp4")
+                    input_args += ["-ss", str(cut["start"]), "-to", str(cut["end"]), "-i", video_path]
+                    output_args += [
+                        "-map", f"{cut_index}:v",
+                        "-map", f"{cut_index}:a?",
+                        "-c", "copy",
+                        segment_output_path
+                    ]
+                    segments.append(segment_output_path)
+
+                clip_states[name] = "cutting"
+                report(f"Klip kesiliyor: {name}")
+                metrics.run_ffmpeg(["ffmpeg", "-y"] + input_args + output_args, "batch.segment",
+                                   check=True, capture_output=True)
+
+                clip_states[name] = "concatenating"
+                report(f"Klip birleştiriliyor: {name}")
+                _concat_segments(segments, output_path, temp_dir, "batch.concat")
+                clip_states[name] = "done"
+                results.append({"name": name, "status": "success", "output_path": output_path})
+            except subprocess.CalledProcessError as e:
+                clip_states[name] = "error"
+                results.append({"name": name, "status": "error", "message": e.stderr.decode(errors="replace")})
+                # Yarım kalan segmentler temp_segments dizininin silinmesini engellemesin
+                for segment_file in segments:
+                    if os.path.exists(segment_file):
+                        os.remove(segment_file)
+            report(f"{len(results)}/{len(clips)} klip tamamlandı")
+
+        try:
+            os.rmdir(temp_dir)
+        except OSError:
+            pass
+
+        manifest_path = os.path.join(output_dir, "manifest.json")
+        with open(manifest_path, "w") as f:
+            json.dump({"source": video_path, "clips": results}, f, ensure_ascii=False, indent=2)
+
+        print(f"Toplu dışa aktarma tamamlandı: {manifest_path}")
+        status = "success" if all(r["status"] == "success" for r in results) else "partial"
+        return {"status": status, "clips": results, "manifest_path": manifest_path}
+
+    except Exception as e:
+        print(f"Beklenmedik toplu dışa aktarma hatası: {e}")
+        return {"status": "error", "message": f"Beklenmedik hata: {e}"}
+
+
+def _parse_ai_response(text):
+    """Gemini yanıtındaki JSON'dan (mesaj, kesimler) çıkarır; markdown kod bloğunu temizler."""
+    if "```json" in text:
+        text = text.split("```json")[1].split("```")[0].strip()
+    elif "```" in text:
+        text = text.split("```")[1].strip()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return text, []
+    return data.get("ai_message") or data.get("message") or "", data.get("cuts", [])
+
+
+# --- Uzun video modu: pencereli map-reduce analiz ---
+
+@celery_app.task(bind=True, name='tasks.long_video_chat_task')
+def long_video_chat_task(self, video_path, video_id, user_message):
+    """
+    Videoyu Gemini'ye bir kez yükler, zaman çizelgesini örtüşen pencerelere
+    böler ve her pencereyi ayrı bir analyze_window görevinde eşzamanlı analiz
+    ettirir. Sonuçlar merge_window_cuts ile birleştirilir; görev kendini bu
+    chord ile değiştirdiği için nihai sonuç aynı task_id altında okunur.
+    """
+    print(f"Uzun video analiz görevi başladı: {video_id}")
+    video_path = media.resolve_video_path(video_path)
+    try:
+        cmd = [
+            'ffprobe',
+            '-v', 'error',
+            '-show_entries', 'format=duration',
+            '-of', 'default=noprint_wrappers=1:nokey=1',
+            video_path
+        ]
+        result = metrics.run_ffmpeg(cmd, "long.ffprobe", capture_output=True, text=True, check=True)
+        duration = float(result.stdout.strip())
+
+        self.update_state(state="PROGRESS", meta={"status": "Video Gemini'ye yükleniyor..."})
+        client = get_genai_client()
+        with metrics.stage("gemini.upload", video_id=video_id):
+            uploaded_file = client.files.upload(file=video_path)
+        metrics.record_gemini_upload(video_path)
+        with metrics.stage("gemini.processing_wait", video_id=video_id):
+            while uploaded_file.state == "PROCESSING":
+                time.sleep(1)
+                uploaded_file = client.files.get(name=uploaded_file.name)
+        if uploaded_file.state == "FAILED":
+            return {"status": "error", "message": "Video Gemini'ye yüklenemedi.", "cuts": []}
+    except subprocess.CalledProcessError as e:
+        print(f"FFprobe hatası: {e}")
+        return {"status": "error", "message": f"Video analiz hatası: {e}", "cuts": []}
+    except Exception as e:
+        print(f"Beklenmedik uzun video analiz hatası: {e}")
+        return {"status": "error", "message": f"Beklenmedik hata: {e}", "cuts": []}
+
+    file_info = {"name": uploaded_file.name, "uri": uploaded_file.uri, "mime_type": uploaded_file.mime_type}
+    windows = planner.plan_windows(duration, Config.LONG_VIDEO_WINDOW_SECONDS, Config.LONG_VIDEO_WINDOW_OVERLAP_SECONDS)
+    print(f"{video_id}: {len(windows)} pencere analiz edilecek")
+    self.update_state(state="PROGRESS", meta={"status": f"{len(windows)} pencere analiz ediliyor..."})
+
+    workflow = chord(
+        [analyze_window.s(file_info, video_id, user_message, start, end) for start, end in windows],
+        merge_window_cuts.s(file_info, video_id, user_message, duration)
+    )
+    raise self.replace(workflow)
+
+
+@celery_app.task(name='tasks.analyze_window')
+def analyze_window(file_info, video_id, user_message, window_start, window_end):
+    """Tek bir pencereyi analiz eder; kesimleri mutlak saniyelere çevirip döndürür."""
+    from google.genai import types
+    try:
+        window_length = window_end - window_start
+        prompt = f"""
+        {Config.GEMINI_SYSTEM_PROMPT}
+
+        {planner.range_prompt(window_start, window_end)}
+        Cevabı `message` ve `cuts` anahtarlarıyla JSON olarak döndür.
+
+        Kullanıcı mesajı: {user_message}
+        """
+        # Zaman aralığı pencerenin kendisidir; mesaj yalnızca metin tokenı için verilir
+        sampling_plan = planner.plan_sampling(window_length, "", Config.GEMINI_TOKEN_BUDGET, prompt_text=prompt)
+        contents = [
+            types.Content(
+                role="user",
+                parts=[
+                    types.Part(
+                        file_data=types.FileData(file_uri=file_info["uri"], mime_type=file_info["mime_type"]),
+                        video_metadata=types.VideoMetadata(
+                            fps=sampling_plan["fps"],
+                            start_offset=f"{window_start:.0f}s",
+                            end_offset=f"{window_end:.0f}s",
+                        ),
+                    ),
+                    types.Part.from_text(text=prompt),
+                ]
+            )
+        ]
+        config = types.GenerateContentConfig(
+            response_mime_type="application/json",
+            media_resolution=(
+                types.MediaResolution.MEDIA_RESOLUTION_LOW
+                if sampling_plan["media_resolution"] == "low" else None
+            ),
+        )
+        with metrics.stage("gemini.generate_content", video_id=video_id, window_start=window_start):
+            response = get_genai_client().models.generate_content(
+                model=Config.GEMINI_MODEL, contents=contents, config=config
+            )
+
+        ai_message, cuts = _parse_ai_response(response.text)
+        absolute_cuts = [list(cut) for cut in planner.to_absolute_cuts(cuts, window_start, window_end)]
+        return {"status": "success", "window": [window_start, window_end], "ai_message": ai_message, "cuts": absolute_cuts}
+
+    except Exception as e:
+        print(f"Pencere analiz hatası ({window_start}-{window_end}): {e}")
+        return {"status": "error", "window": [window_start, window_end], "message": str(e), "cuts": []}
+
+
+@celery_app.task(name='tasks.merge_window_cuts')
+def merge_window_cuts(window_results, file_info, video_id, user_message, duration):
+    """Pencere sonuçlarını birleştirir, örtüşmelerdeki tekrar eden kesimleri ayıklar."""
+    try:
+        get_genai_client().files.delete(name=file_info["name"])
+    except Exception:
+        pass  # Dosya silme hatası önemli değil
+
+    all_cuts = [(start, end) for result in window_results for start, end in result["cuts"]]
+    cuts = [
+        {"start": planner.format_timestamp(start), "end": planner.format_timestamp(min(end, duration))}
+        for start, end in planner.merge_cuts(all_cuts)
+    ]
+    messages = [
+        f"[{planner.format_timestamp(r['window'][0])} - {planner.format_timestamp(r['window'][1])}] {r['ai_message']}"
+        for r in window_results if r["status"] == "success" and r.get("ai_message")
+    ]
+    failed_windows = sum(1 for r in window_results if r["status"] != "success")
+    ai_message = "\n".join(messages)
+    if failed_windows:
+        ai_message += f"\n({failed_windows} pencere analiz edilemedi.)"
+
+    chat_history_key = Config.REDIS_CHAT_HISTORY_KEY.format(video_id)
+    current_history = json.loads(get_redis_client().get(chat_history_key) or "[]")
+    current_history.append({"role": "model", "parts": [{"text": ai_message}]})
+    get_redis_client().set(chat_history_key, json.dumps(current_history))
 
+    return {
+        "status": "success" if failed_windows < len(window_results) else "error",
+        "cuts": cuts,
+        "ai_message": ai_message,
+        "windows": len(window_results),
+    }
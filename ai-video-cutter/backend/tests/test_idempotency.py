@@ -0,0 +1,114 @@
+import pytest
+
+pytest.importorskip("prometheus_client")
+pytest.importorskip("redis")
+
+import idempotency
+
+
+class FakeLock:
+    def __init__(self, acquired=True):
+        self.acquired = acquired
+        self.released = False
+
+    def acquire(self):
+        return self.acquired
+
+    def release(self):
+        self.released = True
+
+
+class FakeRedis:
+    def __init__(self, lock_acquired=True):
+        self.store = {}
+        self.lock_acquired = lock_acquired
+        self.locks = []
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def set(self, key, value, ex=None):
+        self.store[key] = value
+
+    def lock(self, name, timeout=None, blocking_timeout=None):
+        lock = FakeLock(self.lock_acquired)
+        self.locks.append(lock)
+        return lock
+
+
+def _starter(task_id="task-1"):
+    calls = []
+
+    def start():
+        calls.append(task_id)
+        return {"task_id": task_id}
+    return start, calls
+
+
+def test_same_key_and_payload_returns_stored_response():
+    redis_client = FakeRedis()
+    start, calls = _starter()
+    payload = {"video_id": "v1", "cuts": [[1, 2]]}
+    first = idempotency.single_flight(redis_client, "finalize", start, idempotency_key="k", payload=payload)
+    second = idempotency.single_flight(redis_client, "finalize", start, idempotency_key="k", payload=payload)
+    assert first == ({"task_id": "task-1"}, True)
+    assert second == ({"task_id": "task-1"}, False)
+    assert calls == ["task-1"]
+    assert all(lock.released for lock in redis_client.locks)
+
+
+def test_same_key_with_different_payload_conflicts():
+    redis_client = FakeRedis()
+    start, calls = _starter()
+    idempotency.single_flight(redis_client, "finalize", start, idempotency_key="k", payload={"video_id": "v1"})
+    with pytest.raises(idempotency.IdempotencyConflict):
+        idempotency.single_flight(redis_client, "finalize", start, idempotency_key="k", payload={"video_id": "v2"})
+    assert calls == ["task-1"]
+
+
+def test_payload_only_restarts_after_task_finished():
+    redis_client = FakeRedis()
+    states = {"task-1": "STARTED"}
+    start, calls = _starter()
+    payload = {"video_id": "v1", "message": "özetle"}
+    idempotency.single_flight(redis_client, "chat", start, payload=payload, task_state=states.get)
+    _, started = idempotency.single_flight(redis_client, "chat", start, payload=payload, task_state=states.get)
+    assert not started
+    states["task-1"] = "SUCCESS"
+    _, started = idempotency.single_flight(redis_client, "chat", start, payload=payload, task_state=states.get)
+    assert started
+    assert calls == ["task-1", "task-1"]
+
+
+def test_prepare_runs_outside_lock_and_is_discarded_on_busy_lock():
+    redis_client = FakeRedis(lock_acquired=False)
+    discarded = []
+
+    def prepare():
+        assert redis_client.locks == []
+        return "saved-file"
+
+    with pytest.raises(idempotency.SingleFlightBusy):
+        idempotency.single_flight(redis_client, "upload", lambda prepared: {"task_id": prepared},
+                                  idempotency_key="k", payload={"filename": "a.mp4"},
+                                  prepare=prepare, discard=discarded.append)
+    assert discarded == ["saved-file"]
+
+
+def test_prepare_skipped_when_key_already_recorded():
+    redis_client = FakeRedis()
+    prepared = []
+
+    def prepare():
+        prepared.append(True)
+        return "saved-file"
+
+    def start(value):
+        return {"task_id": value}
+
+    payload = {"filename": "a.mp4"}
+    idempotency.single_flight(redis_client, "upload", start, idempotency_key="k", payload=payload, prepare=prepare)
+    response, started = idempotency.single_flight(redis_client, "upload", start, idempotency_key="k",
+                                                  payload=payload, prepare=prepare)
+    assert (response, started) == ({"task_id": "saved-file"}, False)
+    assert prepared == [True]
@@ -0,0 +1,110 @@
+import pytest
+
+import planner
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("45", 45.0),
+    ("01:30", 90.0),
+    ("01:00:05", 3605.0),
+    ("00:00:02.5", 2.5),
+    (12, 12.0),
+])
+def test_parse_timestamp(value, expected):
+    assert planner.parse_timestamp(value) == expected
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("son 5 dakikada ne oluyor?", (3300.0, 3600)),
+    ("what happens in the last 5 minutes", (3300.0, 3600)),
+    ("ilk 90 saniyeyi özetle", (0.0, 90.0)),
+    ("first 2 mins please", (0.0, 120.0)),
+    ("01:00 - 02:30 arası", (60.0, 150.0)),
+    ("00:10:00 ile 00:12:30 arasını kes", (600.0, 750.0)),
+    ("son 2 saatte neler oldu", (0.0, 3600)),
+    ("last 30 secs", (3570.0, 3600)),
+    ("final 10 s.", (3590.0, 3600)),
+])
+def test_parse_time_range(message, expected):
+    assert planner.parse_time_range(message, 3600) == expected
+
+
+@pytest.mark.parametrize("message", [
+    "genel bir özet çıkar",
+    "last 3 moments",
+    "5 - 10 kişi görünüyor mu",
+    "02:30 - 01:00",
+    "show the person 5 minutes into the video",
+    "semifinal 10 minutes highlights",
+    "cut the lesson 3 minutes in",
+    "last 3 sections",
+])
+def test_parse_time_range_without_range(message):
+    assert planner.parse_time_range(message, 3600) is None
+
+
+def test_parse_time_range_clamps_to_duration():
+    assert planner.parse_time_range("son 10 dakika", 120) == (0.0, 120)
+
+
+def test_plan_sampling_short_video_uses_max_fps():
+    plan = planner.plan_sampling(60, "özetle", 300000)
+    assert plan["fps"] == 15
+    assert plan["media_resolution"] == "default"
+    assert plan["start_offset"] is None and plan["end_offset"] is None
+
+
+def test_plan_sampling_stays_within_budget_and_counts_text():
+    prompt = "x" * 4000
+    plan = planner.plan_sampling(3600, "özetle", 300000, prompt_text=prompt)
+    assert plan["expected_text_tokens"] == 1000
+    assert plan["expected_tokens"] == plan["expected_video_tokens"] + 1000
+    assert plan["expected_tokens"] <= 300000
+
+
+def test_plan_sampling_uses_requested_range():
+    plan = planner.plan_sampling(3600, "last 5 minutes", 300000)
+    assert (plan["start_offset"], plan["end_offset"]) == (3300.0, 3600)
+    assert plan["fps"] > planner.plan_sampling(3600, "özetle", 300000)["fps"]
+
+
+def test_plan_windows_single_window():
+    assert planner.plan_windows(300, 600, 30) == [(0.0, 300.0)]
+
+
+def test_plan_windows_overlap():
+    assert planner.plan_windows(1500, 600, 30) == [(0.0, 600.0), (570.0, 1170.0), (1140.0, 1500)]
+
+
+def test_plan_windows_folds_short_tail():
+    assert planner.plan_windows(600.5, 600, 30) == [(0.0, 600.5)]
+    assert planner.plan_windows(1190, 600, 30) == [(0.0, 600.0), (570.0, 1190)]
+
+
+def test_merge_cuts_collapses_overlapping_duplicates():
+    cuts = [(575.0, 590.0), (10.0, 20.0), (580.0, 600.0)]
+    assert planner.merge_cuts(cuts) == [(10.0, 20.0), (575.0, 600.0)]
+
+
+def test_merge_cuts_keeps_adjacent_and_nearby_cuts():
+    cuts = [(10.0, 20.0), (20.5, 30.0), (30.0, 40.0)]
+    assert planner.merge_cuts(cuts) == cuts
+
+
+def test_format_timestamp():
+    assert planner.format_timestamp(3725.4) == "01:02:05"
+
+
+def test_range_prompt_names_visible_range():
+    assert "00:55:00 - 01:00:00" in planner.range_prompt(3300, 3600)
+
+
+def test_to_absolute_cuts_offsets_clamps_and_skips_invalid():
+    cuts = [
+        {"start": "00:10", "end": "00:20"},
+        {"start": "04:50", "end": "06:00"},
+        {"start": "abc", "end": "00:05"},
+        {"end": "00:05"},
+        {"start": "00:30", "end": "00:10"},
+    ]
+    assert planner.to_absolute_cuts(cuts, 3300, 3600) == [(3310.0, 3320.0), (3590.0, 3600)]
@@ -22,6 +22,9 @@ function App() {
   const [isLoading, setIsLoading] = useState(false)
   const fileInputRef = useRef(null)
   const videoRef = useRef(null)
+  // Tekrar denemelerde aynı işi yeniden başlatmamak için Idempotency-Key değerleri
+  const uploadKeyRef = useRef(null)
+  const finalizeKeyRef = useRef(null)
 
   const API_BASE_URL = 'https://5000-i7bje6rb4wcdrih1optmr-c579c314.manusvm.computer'
 
@@ -29,6 +32,7 @@ function App() {
     const file = event.target.files[0]
     if (file && file.type.startsWith('video/')) {
       setVideoFile(file)
+      uploadKeyRef.current = crypto.randomUUID()
       setVideoId(null)
       setAnalysisStatus('')
       setChatHistory([])
@@ -62,6 +66,9 @@ function App() {
 
       const response = await fetch(`${API_BASE_URL}/api/upload`, {
         method: 'POST',
+        headers: {
+          'Idempotency-Key': uploadKeyRef.current
+        },
         body: formData
       })
 
@@ -174,6 +181,7 @@ function App() {
         setChatHistory(prev => [...prev, { role: "assistant", message: aiResponse.ai_message }])
         
         if (aiResponse.cuts && aiResponse.cuts.length > 0) {
+          finalizeKeyRef.current = crypto.randomUUID()
           setSuggestedCuts(aiResponse.cuts)
         }
       } else if (result.state === "PENDING" || result.state === "PROGRESS") {
@@ -197,7 +205,8 @@ function App() {
       const response = await fetch(`${API_BASE_URL}/api/finalize`, {
         method: 'POST',
         headers: {
-          'Content-Type': 'application/json'
+          'Content-Type': 'application/json',
+          'Idempotency-Key': finalizeKeyRef.current
         },
         body: JSON.stringify({
           video_id: videoId,